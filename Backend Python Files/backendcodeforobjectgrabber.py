@@ -1,145 +1,209 @@
 import cv2
 from ultralytics import YOLO
 import mediapipe as mp
-from transformers import pipeline
-from PIL import Image
+from mediapipe.tasks.python import vision
+from hand_tracking import create_hand_landmarker, to_landmark_proto, SteadyHandTracker, WRIST
+from depth_engine import load_depth_estimator
 import numpy as np
-import math
-from sentence_transformers import SentenceTransformer, util
+import os
+import collections
+import threading
+import time
+from sentence_transformers import SentenceTransformer
+import torch
+import torch.nn.functional as F
+
+# frames are run through YOLO and depth in batches of up to this many
+BATCH_SIZE = 4
+# blend the colourized depth map into the display (needs the full-resolution depth map every frame),
+# so it's debug-only: run with SPECTRA_DEBUG=1 to turn it on
+SHOW_DEPTH = os.getenv("SPECTRA_DEBUG", "") not in ("", "0")
+# every model works on 640x480 frames (YOLO's native 640); bigger camera frames are shrunk on capture
+FRAME_WIDTH, FRAME_HEIGHT = 640, 480
 
 # all model configs
 sentance_model = SentenceTransformer('all-MiniLM-L6-v2')
-# yolo model
-model = YOLO("yolov8l.pt") 
+# yolo model, uses the dynamic-batch TensorRT engine from `export_models.py --batch 8` when it has been built
+if os.path.exists("yolov8l_b8.engine"):
+    model = YOLO("yolov8l_b8.engine", task="detect")
+else:
+    model = YOLO("yolov8l.pt")
+# normalized embeddings of the 80 yolo class names, computed once so each frame only needs a matmul
+class_names = np.array(list(model.names.values()))
+class_embeddings = F.normalize(sentance_model.encode(class_names.tolist(), convert_to_tensor=True), dim=-1)
 
 # depthestimator model also note to SAMMY if running this from ur computer change device to 'cuda' i only put cpu cuz mine isnt powerful enough
-depth_estimator = pipeline(task="depth-estimation", model="depth-anything/Depth-Anything-V2-Small-hf", device='mps')
+# (uses depth_b8.engine from `export_models.py --batch 8` instead when it has been built)
+depth_estimator = load_depth_estimator(device='mps', engine_path="depth_b8.engine")
 # SAMMY PLEASE READ THIS ONE COMMENT
 
-# hand tracker model
+# hand tracker model (MediaPipe Tasks in VIDEO mode so landmarks are tracked between frames,
+# GPU delegate when a GL context is available, CPU otherwise)
 mp_hands = mp.solutions.hands
-hands = mp_hands.Hands(static_image_mode=False,
-                       max_num_hands=2,
-                       min_detection_confidence=0.5,
-                       min_tracking_confidence=0.5)
+hands = create_hand_landmarker(running_mode=vision.RunningMode.VIDEO, num_hands=2)
+# reuses the last landmarks on frames where the hand is confidently tracked and hasn't moved
+hand_tracker = SteadyHandTracker(hands, force_every=3)
 mp_drawing = mp.solutions.drawing_utils
 # model configs done
 
+# octant lookup for the direction index, no trig: key bits are (dx<0, dy<0, |dy| > |dx|*tan22.5, |dy| > |dx|*tan67.5)
+# table filled by enumerating against the old atan2 version (round((atan2(dy, dx) + pi) / (pi/4)) % 8) so it matches exactly
+TAN_22_5 = 0.41421356237309503
+TAN_67_5 = 2.414213562373095
+DIRECTION_LUT = (4, 6, 5, 6, 4, 2, 3, 2, 0, 6, 7, 6, 0, 2, 1, 2)
+
 # get desired object
 i = input('gimme da object')
-query_embedding = sentance_model.encode(i, convert_to_tensor=True)
+query_embedding = F.normalize(sentance_model.encode(i, convert_to_tensor=True), dim=-1)
+# the query never changes, so score it against every class once; per frame it's just a numpy lookup by class id
+class_scores = (class_embeddings @ query_embedding).cpu().numpy()
 # get webcam
 cap = cv2.VideoCapture(0)
 if not cap.isOpened():
     print("Error: Could not open webcam.")
     exit()
+cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # don't let the driver queue up stale frames
+# ask the camera for 640x480 directly so there's nothing to shrink (not every driver listens)
+cap.set(cv2.CAP_PROP_FRAME_WIDTH, FRAME_WIDTH)
+cap.set(cv2.CAP_PROP_FRAME_HEIGHT, FRAME_HEIGHT)
+
+# capture thread: keeps only the newest BATCH_SIZE frames, dropping older ones when inference falls
+# behind, so the loop always works on fresh frames and never waits on a blocking cap.read()
+class LatestFrames:
+    def __init__(self, cap, maxlen=BATCH_SIZE):
+        self.cap = cap
+        self.frames = collections.deque(maxlen=maxlen)
+        self.cond = threading.Condition()
+        self.running = True
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def _loop(self):
+        while self.running:
+            ret, frame = self.cap.read()
+            if ret and (frame.shape[1] != FRAME_WIDTH or frame.shape[0] != FRAME_HEIGHT):
+                frame = cv2.resize(frame, (FRAME_WIDTH, FRAME_HEIGHT), interpolation=cv2.INTER_AREA)
+            with self.cond:
+                if ret:
+                    self.frames.append((int(time.monotonic() * 1000), frame))
+                else:
+                    print("Error: Failed to capture frame.")
+                    self.running = False
+                self.cond.notify()
+
+    # waits for a new frame, then up to `timeout` for more; returns [] once capture has stopped
+    def read_batch(self, timeout=0.01):
+        with self.cond:
+            self.cond.wait_for(lambda: self.frames or not self.running)
+            self.cond.wait_for(lambda: len(self.frames) == self.frames.maxlen or not self.running, timeout=timeout)
+            batch = list(self.frames)
+            self.frames.clear()
+        return batch
+
+    def stop(self):
+        self.running = False
 
 # function for full thing which is called upon wanting to find an object
 def handtoobjectfinder():
     name = ''
     directions = ["Right", "Up-Right", "Up", "Up-Left", 
      "Left", "Down-Left", "Down", "Down-Right"]
+    grabber = LatestFrames(cap)
     while True:
-        ret, frame = cap.read()
-        if not ret:
-            print("Error: Failed to capture frame.")
+        batch = grabber.read_batch()
+        if not batch:
             break
-
-    # Convert the frame to RGB
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        pil_frame = Image.fromarray(rgb_frame)
-    # Run Mediapipe Hands on the frame
-        hand_results = hands.process(rgb_frame)
-
-    # Run YOLO model on the frame
-        yolo_results = model(frame)
-
-        # Run depth-estimation model on the frame
-        depth_result = depth_estimator(pil_frame)
-        depth_map = np.array(depth_result['depth'])  # Extract the depth map (as a NumPy array)
-
-    # Normalize the depth map for visualization (scale to 0-255)
-        normalized_depth = cv2.normalize(depth_map, None, 0, 255, cv2.NORM_MINMAX).astype('uint8')
-        depth_colored = cv2.applyColorMap(normalized_depth, cv2.COLORMAP_MAGMA)  # Colorize for better visualization
-
-        c = 0
-        things = []
-        x1s, y1s, x2s, y2s = 0, 0, 0, 0
-    # Draw YOLO detections
-        for box in yolo_results[0].boxes:
-            class_id = int(box.cls)
-            label = model.names[class_id]
-
-    # no ppl and ppl counter
-            if class_id == 0:
-                c += 1
-                continue
-
-    # Get box coordinates
-            x1, y1, x2, y2 = map(int, box.xyxy[0])  # Bounding box coordinates
-            if name == label:
-                x1s, y1s, x2s, y2s = x1, y1, x2, y2
-    
-
-    # Draw bounding box
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-
-    # Put label and confidence text
-            text = f"{label}"
-            cv2.putText(frame, text, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-            things = things + [model.names[class_id]]
-        # this makes vector vector used later for direction
-        if things != []:
-            doc_embeddings = sentance_model.encode(things, convert_to_tensor=True)
-            cosine_scores = util.cos_sim(query_embedding, doc_embeddings)[0] 
-            ranked_docs = sorted(zip(cosine_scores.tolist(), things), reverse=True, key=lambda x: x[0])
-            score, name = ranked_docs[0]
-        object_x = (x1s + x2s) // 2
-        object_y = (y1s + y2s) // 2
+        timestamps = [timestamp_ms for timestamp_ms, _ in batch]
+        frames = [frame for _, frame in batch]
+
+    # Convert the frames to RGB
+        rgb_frames = [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in frames]
+
+    # Run YOLO model and depth-estimation model on the whole batch at once
+        # half: FP16 when running the .pt weights on CUDA; verbose=False drops the per-frame log line
+        yolo_batch = model(frames, imgsz=640, half=torch.cuda.is_available(), verbose=False)
+        depth_batch = depth_estimator.infer_batch(rgb_frames)
+
+        quit_requested = False
+        for timestamp_ms, frame, rgb_frame, yolo_result, depth in zip(timestamps, frames, rgb_frames, yolo_batch, depth_batch):
+        # Run Mediapipe Hands on the frame (VIDEO mode needs monotonically increasing timestamps)
+            hand_results = hand_tracker.detect_for_video(rgb_frame, timestamp_ms)
+
+        # Normalize the depth map for visualization (scale to 0-255)
+            if SHOW_DEPTH:
+                normalized_depth = cv2.normalize(depth.full(), None, 0, 255, cv2.NORM_MINMAX).astype('uint8')
+                depth_colored = cv2.applyColorMap(normalized_depth, cv2.COLORMAP_MAGMA)  # Colorize for better visualization
+
+        # Pull every box out of YOLO in one go (one device->host copy of the [x1, y1, x2, y2, conf, cls] table)
+            box_data = yolo_result.boxes.data.cpu().numpy()
+            class_ids = box_data[:, 5].astype(np.int32)
+            xyxy = box_data[:, :4].astype(np.int32)
+
+        # no ppl
+            not_person = class_ids != 0
+            class_ids, xyxy = class_ids[not_person], xyxy[not_person]
+            things = class_names[class_ids]
+
+        # Draw YOLO detections
+            for (x1, y1, x2, y2), label in zip(xyxy.tolist(), things):
+                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                cv2.putText(frame, str(label), (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+
+        # Box of the object matched on the previous frame (last one wins if there are several)
+            matches = np.flatnonzero(things == name)
+            x1s, y1s, x2s, y2s = map(int, xyxy[matches[-1]]) if matches.size else (0, 0, 0, 0)
+            # this makes vector vector used later for direction
+            if things.size:
+                name = str(things[int(class_scores[class_ids].argmax())])
+            object_x = (x1s + x2s) // 2
+            object_y = (y1s + y2s) // 2
         
 
-    # HANDS
-        if hand_results.multi_hand_landmarks:
-            for hand_landmarks in hand_results.multi_hand_landmarks:
-                mp_drawing.draw_landmarks(
-                    frame,
-                    hand_landmarks,
-                    mp_hands.HAND_CONNECTIONS,
-                    mp_drawing.DrawingSpec(color=(0, 255, 0), thickness=2, circle_radius=2),
-                    mp_drawing.DrawingSpec(color=(0, 0, 255), thickness=2, circle_radius=2),
-            )
-        if hand_results.multi_hand_landmarks and len(yolo_results[0].boxes) - c != 0:
-            hand_landmarks = hand_results.multi_hand_landmarks[0]
-            hand_x = int(hand_landmarks.landmark[mp_hands.HandLandmark.WRIST].x * 640)
-            hand_y = int(hand_landmarks.landmark[mp_hands.HandLandmark.WRIST].y * 480)
-            dx = object_x - hand_x
-            dy = object_y - hand_y
-            angle_radians = math.atan2(dy, dx)
-            angle_radians = (angle_radians + math.pi) % (2 * math.pi) - math.pi
-            angleindex = round((angle_radians + math.pi) / (math.pi / 4)) % 8
-            dist = math.sqrt((object_x - hand_x)**2 + (object_y - hand_y)**2)
-            if hand_y < 460 and hand_x < 620:
-                obd, handd = depth_map[object_y,object_x], depth_map[hand_y,hand_x]
-                print(obd,handd)
-                if abs(int(handd) - int(obd)) >= 80:
-                    print('go forward')
-                elif (abs(int(handd) - int(obd)) <= 30) and dist <= 150:
-                    print('object within reach')
-                else: print(directions[angleindex])
-            cv2.line(frame, (hand_x, hand_y), (object_x, object_y), (255, 0, 0), 2)
-            print(dist)
-
-
-
-        # IMPORTANT REMEMBER THIS
-        combined_frame = cv2.addWeighted(frame, 0.6, depth_colored, 0.4, 0)  # Blend annotations with depth
-        # UNCOMMENTING THIS WILL BRING DEPTH COLOR BACK TO DEMO
-    # Display the annotated frame
-        cv2.imshow("YOLO + Mediapipe Hands Tracking", combined_frame)
-
-    # Break the loop if 'q' is pressed
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        # HANDS
+            if hand_results.hand_landmarks:
+                for hand_landmarks in hand_results.hand_landmarks:
+                    mp_drawing.draw_landmarks(
+                        frame,
+                        to_landmark_proto(hand_landmarks),
+                        mp_hands.HAND_CONNECTIONS,
+                        mp_drawing.DrawingSpec(color=(0, 255, 0), thickness=2, circle_radius=2),
+                        mp_drawing.DrawingSpec(color=(0, 0, 255), thickness=2, circle_radius=2),
+                )
+            if hand_results.hand_landmarks and class_ids.size != 0:
+                hand_landmarks = hand_results.hand_landmarks[0]
+                hand_x = int(hand_landmarks[WRIST].x * FRAME_WIDTH)
+                hand_y = int(hand_landmarks[WRIST].y * FRAME_HEIGHT)
+                dx = object_x - hand_x
+                dy = object_y - hand_y
+                ax, ay = abs(dx), abs(dy)
+                angleindex = DIRECTION_LUT[((dx < 0) << 3) | ((dy < 0) << 2) | ((ay > ax * TAN_22_5) << 1) | (ay > ax * TAN_67_5)]
+                dist_sq = dx * dx + dy * dy # squared distance, compared against 150*150 so no sqrt
+                if hand_y < 460 and hand_x < 620:
+                    obd, handd = depth.at(object_x, object_y), depth.at(hand_x, hand_y)
+                    print(obd,handd)
+                    depth_gap = abs(handd - obd)
+                    if depth_gap >= 80:
+                        print('go forward')
+                    elif depth_gap <= 30 and dist_sq <= 150 * 150:
+                        print('object within reach')
+                    else: print(directions[angleindex])
+                cv2.line(frame, (hand_x, hand_y), (object_x, object_y), (255, 0, 0), 2)
+                print(dist_sq ** 0.5) # pixel distance, for comparing against the 150 px reach threshold
+
+
+
+            # IMPORTANT REMEMBER THIS
+            combined_frame = cv2.addWeighted(frame, 0.6, depth_colored, 0.4, 0) if SHOW_DEPTH else frame  # Blend annotations with depth
+            # UNCOMMENTING THIS WILL BRING DEPTH COLOR BACK TO DEMO
+        # Display the annotated frame
+            cv2.imshow("YOLO + Mediapipe Hands Tracking", combined_frame)
+
+        # Break the loop if 'q' is pressed
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                quit_requested = True
+                break
+        if quit_requested:
             break
+    grabber.stop()
 
 
 handtoobjectfinder()
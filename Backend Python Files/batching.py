@@ -0,0 +1,68 @@
+"""
+Dynamic micro-batching for the server's per-request model calls.
+
+Requests run in worker threads and each one needs a single item through a model (e.g. one
+query through the sentence encoder). MicroBatcher queues those items and a background thread
+runs whatever has accumulated as one batch, so under concurrent load the per-call overhead
+(tokenization, kernel launches, Python dispatch) is paid once per batch instead of per request.
+A request arriving alone is run immediately rather than waiting for company.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+class MicroBatcher:
+    """Runs single items submitted from many threads through `batch_fn` in batches of up to `max_batch`."""
+
+    def __init__(self, batch_fn, max_batch: int = 8, max_wait: float = 0.0):
+        self.batch_fn = batch_fn # list of items -> sequence of results, in the same order
+        self.max_batch = max_batch
+        self.max_wait = max_wait # Extra seconds to wait for a batch to fill; 0 = take only what is already queued
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, item) -> Future:
+        """Queues one item; the returned future resolves to its result."""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        """Blocking submit()."""
+        return self.submit(item).result()
+
+    def _ensure_started(self) -> None:
+        # Started lazily: threads don't survive fork(), so a thread started in the Gunicorn
+        # master (preload_app) would be missing in the workers
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _next_batch(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            items, futures = zip(*self._next_batch())
+            try:
+                results = self.batch_fn(list(items))
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+            for future, result in zip(futures, results):
+                future.set_result(result)
@@ -0,0 +1,203 @@
+"""
+Depth-Anything-V2-Small inference for the hand-to-object finder.
+
+DepthEngine runs the FP16 TensorRT engine built by export_models.py: the RGB frame is
+normalized into a pinned host buffer, copied to the GPU, executed and copied back on one
+CUDA stream, with no PIL round-trip.
+
+Both estimators return RelativeDepth, which keeps the map at model resolution: callers that
+only compare a couple of points read them with at() and never pay for the full-resolution
+resize, and full() builds the image-sized map for visualization. at() averages a small
+window (from an integral image, so O(1) per point) so a point on a depth edge doesn't flip
+the result. Values are scaled the way the transformers pipeline scaled its 'depth' image
+(0-255, relative, higher = closer), so the depth thresholds used by the callers keep their
+meaning.
+"""
+import os
+import cv2
+import numpy as np
+
+DEPTH_MODEL = "depth-anything/Depth-Anything-V2-Small-hf"
+DEPTH_ENGINE = "depth.engine"
+DEPTH_INPUT_SIZE = 518 # Fixed engine input, a multiple of the ViT patch size (14)
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+class RelativeDepth:
+    """Depth prediction for one frame, kept at model resolution until a full map is asked for."""
+
+    def __init__(self, predicted: np.ndarray, image_size: tuple[int, int]):
+        self.predicted = predicted # (h, w) float32, model resolution
+        self.width, self.height = image_size
+        max_depth = float(np.max(predicted))
+        # A blank prediction (covered lens, uniform frame) reads as depth 0 everywhere instead of dividing by zero
+        self.scale = 255 / max_depth if max_depth > 0 else 0.0
+        self._integral = None # Summed-area table of `predicted`, built on the first at()
+
+    def at(self, x: int, y: int, radius: int = 3) -> float:
+        """
+        Mean depth (0-255 scale) around pixel (x, y) of the original image, over a
+        (2 * radius + 1)^2 window of the prediction (clipped at the borders).
+        """
+        pred_height, pred_width = self.predicted.shape
+        # Clamped to the map: hand landmarks can fall outside the frame
+        pred_y = min(max(0, y * pred_height // self.height), pred_height - 1)
+        pred_x = min(max(0, x * pred_width // self.width), pred_width - 1)
+        if self._integral is None:
+            self._integral = cv2.integral(self.predicted, sdepth=cv2.CV_64F)
+        y0, y1 = max(0, pred_y - radius), min(pred_height, pred_y + radius + 1)
+        x0, x1 = max(0, pred_x - radius), min(pred_width, pred_x + radius + 1)
+        total = self._integral[y1, x1] - self._integral[y0, x1] - self._integral[y1, x0] + self._integral[y0, x0]
+        return float(total) / ((y1 - y0) * (x1 - x0)) * self.scale
+
+    def full(self) -> np.ndarray:
+        """uint8 depth map at the original image resolution."""
+        depth = cv2.resize(self.predicted, (self.width, self.height), interpolation=cv2.INTER_CUBIC)
+        depth *= self.scale
+        return np.clip(depth, 0, 255).astype(np.uint8)
+
+class DepthEngine:
+    """Thin TensorRT wrapper with device buffers allocated once at load time."""
+
+    def __init__(self, engine_path: str = DEPTH_ENGINE):
+        import tensorrt as trt
+        import pycuda.driver as cuda
+        import pycuda.autoprimaryctx # share the primary context with torch instead of creating a new one
+
+        self._cuda = cuda
+        # autoprimaryctx only makes the context current on the importing thread; _enqueue/_collect
+        # push it themselves so the engine can also be driven from worker threads
+        self._cuda_context = pycuda.autoprimaryctx.context
+        logger = trt.Logger(trt.Logger.WARNING)
+        with open(engine_path, "rb") as f, trt.Runtime(logger) as runtime:
+            self.engine = runtime.deserialize_cuda_engine(f.read())
+        self.context = self.engine.create_execution_context()
+        self.stream = cuda.Stream()
+
+        names = [self.engine.get_tensor_name(i) for i in range(self.engine.num_io_tensors)]
+        self.input_name = next(n for n in names if self.engine.get_tensor_mode(n) == trt.TensorIOMode.INPUT)
+        self.output_name = next(n for n in names if self.engine.get_tensor_mode(n) == trt.TensorIOMode.OUTPUT)
+
+        # Engines built with a dynamic batch profile get buffers sized for the profile's max batch
+        input_shape = tuple(self.engine.get_tensor_shape(self.input_name))
+        if input_shape[0] == -1:
+            input_shape = tuple(self.engine.get_tensor_profile_shape(self.input_name, 0)[2])
+        self.context.set_input_shape(self.input_name, input_shape)
+        self.max_batch = input_shape[0]
+
+        # One pinned host buffer and one device buffer per I/O tensor, reused for every frame
+        self.host_buffers = {}
+        self.device_buffers = {}
+        for name in names:
+            shape = tuple(self.context.get_tensor_shape(name))
+            dtype = trt.nptype(self.engine.get_tensor_dtype(name))
+            self.host_buffers[name] = cuda.pagelocked_empty(shape, dtype)
+            self.device_buffers[name] = cuda.mem_alloc(self.host_buffers[name].nbytes)
+            self.context.set_tensor_address(name, int(self.device_buffers[name]))
+
+        # Preprocessing scratch space, also allocated once: the resized frame, and the ImageNet
+        # normalization folded into one multiply-add applied straight into the pinned input buffer
+        self._resized = np.empty((DEPTH_INPUT_SIZE, DEPTH_INPUT_SIZE, 3), dtype=np.uint8)
+        self._scale = 1.0 / (255.0 * IMAGENET_STD)
+        self._offset = -IMAGENET_MEAN / IMAGENET_STD
+
+        self._pending = None # Frames enqueued by infer_async() and not yet collected
+
+    def infer(self, rgb: np.ndarray) -> RelativeDepth:
+        """Returns the relative depth (higher = closer) of `rgb`."""
+        return self.infer_batch([rgb])[0]
+
+    def infer_async(self, rgb: np.ndarray) -> None:
+        """Queues one frame on the engine's CUDA stream and returns immediately; pair with collect()."""
+        self._enqueue([rgb])
+
+    def collect(self) -> RelativeDepth:
+        """Waits for the frame queued by infer_async() and returns its depth."""
+        return self._collect()[0]
+
+    def infer_batch(self, frames: list[np.ndarray]) -> list[RelativeDepth]:
+        """Runs the frames through the engine in chunks of at most `max_batch`."""
+        depth_maps = []
+        for start in range(0, len(frames), self.max_batch):
+            self._enqueue(frames[start:start + self.max_batch])
+            depth_maps.extend(self._collect())
+        return depth_maps
+
+    def _enqueue(self, frames: list[np.ndarray]) -> None:
+        self._cuda_context.push()
+        try:
+            self._enqueue_frames(frames)
+        finally:
+            self._cuda_context.pop()
+
+    def _enqueue_frames(self, frames: list[np.ndarray]) -> None:
+        cuda = self._cuda
+        if self._pending is not None:
+            # A previous infer_async() was never collected; let it finish before reusing its buffers
+            self.stream.synchronize()
+        batch = len(frames)
+        h_in = self.host_buffers[self.input_name][:batch]
+        h_out = self.host_buffers[self.output_name][:batch]
+
+        for i, rgb in enumerate(frames):
+            cv2.resize(rgb, (DEPTH_INPUT_SIZE, DEPTH_INPUT_SIZE), dst=self._resized, interpolation=cv2.INTER_CUBIC)
+            hwc_view = h_in[i].transpose(1, 2, 0) # HWC view onto the pinned CHW input
+            np.multiply(self._resized, self._scale, out=hwc_view, casting="unsafe")
+            np.add(hwc_view, self._offset, out=hwc_view, casting="unsafe")
+
+        self.context.set_input_shape(self.input_name, (batch, 3, DEPTH_INPUT_SIZE, DEPTH_INPUT_SIZE))
+        cuda.memcpy_htod_async(self.device_buffers[self.input_name], h_in, self.stream)
+        self.context.execute_async_v3(stream_handle=self.stream.handle)
+        cuda.memcpy_dtoh_async(h_out, self.device_buffers[self.output_name], self.stream)
+        self._pending = frames
+
+    def _collect(self) -> list[RelativeDepth]:
+        self._cuda_context.push()
+        try:
+            self.stream.synchronize()
+        finally:
+            self._cuda_context.pop()
+        frames, self._pending = self._pending, None
+        h_out = self.host_buffers[self.output_name]
+        # Copy out of the pinned output (it is reused by the next call) at model resolution only
+        return [RelativeDepth(np.array(h_out[i].reshape(DEPTH_INPUT_SIZE, DEPTH_INPUT_SIZE), dtype=np.float32),
+                              (rgb.shape[1], rgb.shape[0]))
+                for i, rgb in enumerate(frames)]
+
+class PipelineDepthEstimator:
+    """Fallback for machines without TensorRT (e.g. Apple silicon): the HF pipeline behind the same interface."""
+
+    def __init__(self, device: str):
+        from transformers import pipeline
+        self.pipeline = pipeline(task="depth-estimation", model=DEPTH_MODEL, device=device)
+
+        self._pending = None
+
+    def infer(self, rgb: np.ndarray) -> RelativeDepth:
+        return self.infer_batch([rgb])[0]
+
+    def infer_async(self, rgb: np.ndarray) -> None:
+        # The pipeline is synchronous, so the work happens in collect()
+        self._pending = rgb
+
+    def collect(self) -> RelativeDepth:
+        rgb, self._pending = self._pending, None
+        return self.infer(rgb)
+
+    def infer_batch(self, frames: list[np.ndarray]) -> list[RelativeDepth]:
+        from PIL import Image
+        results = self.pipeline([Image.fromarray(rgb) for rgb in frames])
+        # Use the raw predicted_depth tensor rather than converting the rendered 'depth' image back to NumPy
+        return [RelativeDepth(result['predicted_depth'].squeeze().float().cpu().numpy(), (rgb.shape[1], rgb.shape[0]))
+                for result, rgb in zip(results, frames)]
+
+def load_depth_estimator(device: str, engine_path: str = DEPTH_ENGINE):
+    """Loads the TensorRT engine if it has been built, otherwise the transformers pipeline on `device`."""
+    if os.path.exists(engine_path):
+        try:
+            return DepthEngine(engine_path)
+        except ImportError as e:
+            print(f"TensorRT/PyCUDA not available ({e}), using the transformers depth pipeline.")
+    else:
+        print(f"{engine_path} not found, using the transformers depth pipeline. Run export_models.py to build it.")
+    return PipelineDepthEstimator(device)
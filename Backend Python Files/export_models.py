@@ -0,0 +1,148 @@
+"""
+One-time export of the Spectra backend models to TensorRT engines (and the sentence
+encoder to INT8 ONNX).
+
+Engines are tied to the GPU and TensorRT version they were built with, so run this
+on the deployment machine (from this directory) before starting the server:
+
+    python export_models.py                 # FP16 YOLO and depth engines (server, batch 1), FP32 + INT8 MiniLM
+    python export_models.py --batch 8       # dynamic-batch engines for the webcam script
+    python export_models.py yolo --int8 --data coco.yaml   # INT8 YOLO, calibrated on a representative set
+"""
+import argparse
+import os
+import shutil
+from ultralytics import YOLO
+from depth_engine import DEPTH_MODEL, DEPTH_ENGINE, DEPTH_INPUT_SIZE
+from sentence_encoder import SBERT_MODEL, SBERT_ONNX, SBERT_INT8_ONNX
+
+YOLO_WEIGHTS = "yolov8l.pt"
+YOLO_IMGSZ = 640
+
+def batched_path(path: str, batch: int) -> str:
+    """Name of the dynamic-batch variant of a model file, e.g. depth.engine -> depth_b8.engine."""
+    root, ext = os.path.splitext(path)
+    return f"{root}_b{batch}{ext}"
+
+def export_yolo(weights: str = YOLO_WEIGHTS, int8: bool = False, data: str | None = None, batch: int = 1) -> str:
+    """
+    Exports YOLOv8 to a TensorRT engine next to the weights.
+
+    batch=1 gives the fixed-shape (640x640) engine the server uses; larger values build a
+    dynamic-batch engine (up to `batch` images) saved under a _b<batch> suffix.
+    """
+    if batch > 1:
+        # Ultralytics names the engine after the weights, so export from a suffixed copy
+        # rather than overwriting the batch-1 engine
+        weights = shutil.copyfile(weights, batched_path(weights, batch))
+    model = YOLO(weights)
+    export_args = dict(format="engine", imgsz=YOLO_IMGSZ, device=0, dynamic=batch > 1, batch=batch, workspace=4)
+    if int8:
+        # INT8 needs a calibration set; check the mAP drop on it before shipping the engine
+        export_args.update(int8=True, data=data)
+    else:
+        export_args.update(half=True)
+    engine_path = model.export(**export_args)
+    print(f"YOLO engine written to {engine_path}")
+    return engine_path
+
+def export_depth(model_id: str = DEPTH_MODEL, onnx_path: str = "depth.onnx", engine_path: str = DEPTH_ENGINE,
+                 batch: int = 1) -> str:
+    """
+    Exports Depth-Anything-V2 to ONNX at a fixed 518x518 input and builds an FP16 TensorRT engine from it.
+
+    batch > 1 exports a dynamic batch axis and builds the engine with a 1 / batch//2 / batch
+    min/opt/max profile, saved under a _b<batch> suffix.
+    """
+    import torch
+    from transformers import AutoModelForDepthEstimation
+
+    depth_model = AutoModelForDepthEstimation.from_pretrained(model_id).eval()
+    depth_model.config.return_dict = False # Plain tuple outputs for the ONNX tracer
+    dummy = torch.randn(1, 3, DEPTH_INPUT_SIZE, DEPTH_INPUT_SIZE)
+    dynamic_axes = {"img": {0: "batch"}, "depth": {0: "batch"}} if batch > 1 else None
+    with torch.no_grad():
+        torch.onnx.export(depth_model, dummy, onnx_path, opset_version=17,
+                          input_names=["img"], output_names=["depth"], dynamic_axes=dynamic_axes)
+    print(f"Depth ONNX model written to {onnx_path}")
+
+    if batch > 1:
+        engine_path = batched_path(engine_path, batch)
+    build_fp16_engine(onnx_path, engine_path, batch)
+    print(f"Depth engine written to {engine_path}")
+    return engine_path
+
+def build_fp16_engine(onnx_path: str, engine_path: str, batch: int = 1, workspace_gb: int = 4) -> None:
+    """
+    Parses an ONNX model with the TensorRT builder API and serializes an FP16 engine.
+
+    batch > 1 expects a dynamic batch axis on every input and adds a 1 / batch//2 / batch
+    min/opt/max optimization profile for it.
+    """
+    import tensorrt as trt
+
+    logger = trt.Logger(trt.Logger.WARNING)
+    builder = trt.Builder(logger)
+    network = builder.create_network(1 << int(trt.NetworkDefinitionCreationFlag.EXPLICIT_BATCH))
+    parser = trt.OnnxParser(network, logger)
+    if not parser.parse_from_file(onnx_path):
+        errors = "\n".join(str(parser.get_error(i)) for i in range(parser.num_errors))
+        raise RuntimeError(f"Failed to parse {onnx_path}:\n{errors}")
+
+    config = builder.create_builder_config()
+    config.set_flag(trt.BuilderFlag.FP16)
+    config.set_memory_pool_limit(trt.MemoryPoolType.WORKSPACE, workspace_gb << 30)
+    if batch > 1:
+        profile = builder.create_optimization_profile()
+        for i in range(network.num_inputs):
+            tensor = network.get_input(i)
+            shape = tuple(tensor.shape)[1:]
+            profile.set_shape(tensor.name, (1, *shape), (max(1, batch // 2), *shape), (batch, *shape))
+        config.add_optimization_profile(profile)
+
+    serialized_engine = builder.build_serialized_network(network, config)
+    if serialized_engine is None:
+        raise RuntimeError(f"TensorRT failed to build an engine from {onnx_path}")
+    with open(engine_path, "wb") as f:
+        f.write(serialized_engine)
+
+def export_sbert(model_id: str = SBERT_MODEL, onnx_path: str = SBERT_ONNX, quantized_path: str = SBERT_INT8_ONNX,
+                 export_dir: str = "minilm_onnx") -> str:
+    """
+    Exports the MiniLM transformer with Optimum (feature-extraction task, dynamic batch/sequence) and
+    quantizes its weights to dynamic INT8 with ORTQuantizer. Both the FP32 and the INT8 model are kept:
+    ONNX Runtime's CUDA provider has no kernels for the dynamic INT8 ops, so CUDA hosts use the FP32 one.
+    """
+    from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+
+    ort_model = ORTModelForFeatureExtraction.from_pretrained(model_id, export=True)
+    ort_model.save_pretrained(export_dir)
+    shutil.copyfile(os.path.join(export_dir, "model.onnx"), onnx_path)
+    print(f"MiniLM ONNX model written to {onnx_path}")
+
+    quantizer = ORTQuantizer.from_pretrained(ort_model)
+    quantization_config = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    quantizer.quantize(save_dir=export_dir, quantization_config=quantization_config)
+    shutil.copyfile(os.path.join(export_dir, "model_quantized.onnx"), quantized_path)
+    print(f"INT8 MiniLM written to {quantized_path}")
+    return quantized_path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export Spectra models to TensorRT engines.")
+    parser.add_argument("targets", nargs="*", choices=["yolo", "depth", "sbert"], default=["yolo", "depth", "sbert"],
+                        help="Models to export (default: all).")
+    parser.add_argument("--int8", action="store_true", help="Build an INT8 YOLO engine instead of FP16.")
+    parser.add_argument("--data", help="Dataset yaml used for INT8 calibration (required with --int8).")
+    parser.add_argument("--batch", type=int, default=1,
+                        help="Max batch size; values above 1 build dynamic-batch engines (default: 1).")
+    args = parser.parse_args()
+    if args.int8 and not args.data:
+        parser.error("--int8 requires --data for calibration")
+
+    if "yolo" in args.targets:
+        export_yolo(int8=args.int8, data=args.data, batch=args.batch)
+    if "depth" in args.targets:
+        export_depth(batch=args.batch)
+    if "sbert" in args.targets:
+        export_sbert()
@@ -0,0 +1,32 @@
+"""
+Production server config. Run from this directory with:
+
+    gunicorn main:app -c gunicorn.conf.py
+
+On CPU-only hosts preload_app imports main.py (and so loads every model) once in the master
+process; the workers are then fork()ed from it and share the model weights copy-on-write
+instead of each loading its own ~5 GB copy. The MediaPipe hand landmarkers are the exception:
+they don't survive fork(), so each worker builds its own at startup.
+
+Neither CUDA nor Metal (MPS) state survives fork(), and main.py touches the GPU at import
+(TensorRT engines, torch CUDA streams, the YOLO export, the depth model on MPS). On CUDA hosts
+and Macs preload is therefore off by default and every worker loads the models onto the device
+itself; each worker holds a full copy in GPU memory, so a single worker is the default there.
+SPECTRA_PRELOAD=0/1 overrides the detection. Start through start_server.sh, which builds a missing
+YOLO engine before the workers boot.
+"""
+import os
+import sys
+
+# Checked without torch.cuda / torch.backends.mps, which would set up the device in the master
+CUDA_HOST = os.path.exists("/dev/nvidiactl") # The NVIDIA driver's device node
+MPS_HOST = sys.platform == "darwin" # main.py loads the depth model with device='mps'
+
+bind = os.getenv("SPECTRA_BIND", "0.0.0.0:8000")
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("SPECTRA_PRELOAD", "0" if CUDA_HOST or MPS_HOST else "1") == "1"
+workers = int(os.getenv("SPECTRA_WORKERS", "4" if preload_app else "1"))
+# OCR / GPT / the startup warmup can be slow. Without preload each worker also loads every model (and
+# torch.compiles the sentence encoder) while booting, and the timeout applies to that too
+timeout = int(os.getenv("SPECTRA_TIMEOUT", "120" if preload_app else "600"))
+backlog = 2048 # Let bursts queue at the socket while requests are micro-batched inside each worker
@@ -0,0 +1,155 @@
+"""
+Hand landmark detection through the MediaPipe Tasks HandLandmarker.
+
+The legacy mp.solutions.hands graph only runs on the CPU (XNNPACK) from Python. The Tasks
+API can route the palm detector and landmark model through the GPU delegate instead; that
+needs a working GL context, so creation falls back to the CPU delegate when it fails.
+"""
+import os
+import queue
+import threading
+import cv2
+import numpy as np
+import mediapipe as mp
+from mediapipe.framework.formats import landmark_pb2
+from mediapipe.tasks.python import BaseOptions, vision
+
+# Download from https://storage.googleapis.com/mediapipe-models/hand_landmarker/hand_landmarker/float16/latest/hand_landmarker.task
+HAND_LANDMARKER_MODEL = "hand_landmarker.task"
+WRIST = 0 # Index of the wrist among the 21 hand landmarks
+
+def _landmarker_options(delegate, running_mode, num_hands: int, model_path: str):
+    return vision.HandLandmarkerOptions(
+        base_options=BaseOptions(model_asset_path=model_path, delegate=delegate),
+        running_mode=running_mode,
+        num_hands=num_hands,
+        min_hand_detection_confidence=0.5,
+        min_tracking_confidence=0.5)
+
+def create_hand_landmarker(running_mode=vision.RunningMode.IMAGE, num_hands: int = 2,
+                           model_path: str = HAND_LANDMARKER_MODEL):
+    """Creates a HandLandmarker on the GPU delegate, or on the CPU if GPU init fails."""
+    try:
+        landmarker = vision.HandLandmarker.create_from_options(
+            _landmarker_options(BaseOptions.Delegate.GPU, running_mode, num_hands, model_path))
+        print("Hand landmarker running on the GPU delegate")
+        return landmarker
+    except Exception as e:
+        print(f"GPU delegate unavailable for hand landmarker ({e}), falling back to CPU")
+        return vision.HandLandmarker.create_from_options(
+            _landmarker_options(BaseOptions.Delegate.CPU, running_mode, num_hands, model_path))
+
+def to_mp_image(rgb) -> mp.Image:
+    """Wraps a contiguous uint8 RGB array for the Tasks API."""
+    return mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb)
+
+def to_landmark_proto(hand_landmarks) -> landmark_pb2.NormalizedLandmarkList:
+    """Converts Tasks landmarks to the proto mp.solutions.drawing_utils expects."""
+    proto = landmark_pb2.NormalizedLandmarkList()
+    proto.landmark.extend([landmark_pb2.NormalizedLandmark(x=lm.x, y=lm.y, z=lm.z) for lm in hand_landmarks])
+    return proto
+
+class HandLandmarkerPool:
+    """
+    Fixed set of IMAGE-mode HandLandmarkers shared between request threads. A landmarker
+    instance must not be called from two threads at once, so each detect() borrows one from
+    the pool and concurrent requests run on separate instances instead of queueing on one.
+    """
+
+    def __init__(self, size: int, num_hands: int = 2, model_path: str = HAND_LANDMARKER_MODEL):
+        self.size = size
+        self.num_hands = num_hands
+        self.model_path = model_path
+        self.landmarkers = []
+        self._idle = queue.Queue()
+        self._pid = None # Process the landmarkers were built in
+        self._create_lock = threading.Lock()
+
+    def _ensure_created(self) -> None:
+        # Built lazily in the process that uses them: MediaPipe graphs (executor threads, GL
+        # contexts) don't survive fork(), so ones built in the Gunicorn master (preload_app)
+        # would be broken in the workers
+        if self._pid == os.getpid():
+            return
+        with self._create_lock:
+            if self._pid != os.getpid():
+                self.landmarkers = [create_hand_landmarker(vision.RunningMode.IMAGE, self.num_hands, self.model_path)
+                                    for _ in range(self.size)]
+                self._idle = queue.Queue()
+                for landmarker in self.landmarkers:
+                    self._idle.put(landmarker)
+                self._pid = os.getpid()
+
+    def detect(self, rgb):
+        """Runs hand detection on an RGB array with whichever landmarker is free."""
+        self._ensure_created()
+        landmarker = self._idle.get()
+        try:
+            return landmarker.detect(to_mp_image(rgb))
+        finally:
+            self._idle.put(landmarker)
+
+    def warmup(self, size: int = 64) -> None:
+        """Runs every instance once on a blank frame so graph / delegate initialization happens up front."""
+        self._ensure_created()
+        blank = np.zeros((size, size, 3), dtype=np.uint8)
+        for _ in self.landmarkers:
+            self.detect(blank)
+
+class SteadyHandTracker:
+    """
+    Video-mode wrapper that skips the landmarker on frames where the hand has not moved.
+
+    MediaPipe already only re-runs palm detection when tracking confidence drops. In the
+    webcam loop we go one step further and reuse the previous landmarks outright while the
+    last result was confident and the pixels inside its hand ROI are essentially unchanged.
+    A fresh detection is forced every `force_every` frames, whenever confidence is below
+    `min_presence`, and while no hand is visible.
+    """
+
+    def __init__(self, landmarker, force_every: int = 3, min_presence: float = 0.9,
+                 motion_threshold: float = 4.0, roi_padding: float = 0.1):
+        self.landmarker = landmarker
+        self.force_every = force_every
+        self.min_presence = min_presence
+        self.motion_threshold = motion_threshold # Mean abs grey-level change inside the ROI
+        self.roi_padding = roi_padding
+        self._last_result = None
+        self._last_presence = 0.0
+        self._last_gray = None # Frame the last real detection ran on
+        self._frames_since_detect = 0
+
+    def detect_for_video(self, rgb, timestamp_ms: int):
+        gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+        if self._can_reuse(gray):
+            self._frames_since_detect += 1
+            return self._last_result
+
+        result = self.landmarker.detect_for_video(to_mp_image(rgb), timestamp_ms)
+        self._last_result = result
+        self._last_presence = min((hand[0].score for hand in result.handedness), default=0.0)
+        self._last_gray = gray
+        self._frames_since_detect = 0
+        return result
+
+    def _can_reuse(self, gray) -> bool:
+        if self._last_result is None or not self._last_result.hand_landmarks:
+            return False
+        if self._frames_since_detect + 1 >= self.force_every or self._last_presence < self.min_presence:
+            return False
+        x0, y0, x1, y1 = self._last_roi(gray.shape)
+        motion = cv2.absdiff(gray[y0:y1, x0:x1], self._last_gray[y0:y1, x0:x1]).mean()
+        return float(motion) < self.motion_threshold
+
+    def _last_roi(self, shape):
+        """Padded pixel bounding box around every landmark of the last result."""
+        height, width = shape[:2]
+        xs = [lm.x for hand in self._last_result.hand_landmarks for lm in hand]
+        ys = [lm.y for hand in self._last_result.hand_landmarks for lm in hand]
+        pad_x = (max(xs) - min(xs)) * self.roi_padding
+        pad_y = (max(ys) - min(ys)) * self.roi_padding
+        x0 = min(max(0, int((min(xs) - pad_x) * width)), width - 1)
+        y0 = min(max(0, int((min(ys) - pad_y) * height)), height - 1)
+        x1 = max(x0 + 1, min(width, int((max(xs) + pad_x) * width) + 1))
+        y1 = max(y0 + 1, min(height, int((max(ys) + pad_y) * height) + 1))
+        return x0, y0, x1, y1
@@ -7,6 +7,9 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
+# One client for the whole script so its HTTP connection pool is reused
+OAI_CLIENT = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))  # Get API key from environment variable
+
 def capture_image():
     cap = cv2.VideoCapture(0)
     if not cap.isOpened():
@@ -20,16 +23,15 @@ def capture_image():
         print("Error: Could not capture image.")
         return None
 
-    image_path = "captured_image.jpg"
-    cv2.imwrite(image_path, frame)
-    print(f"Image captured and saved as {image_path}")
-    return image_path
-
-def analyze_image_with_gpt(image_path, api_key):
-    client = OpenAI(api_key=api_key)
+    print("Image captured")
+    return frame
 
-    with open(image_path, "rb") as image_file:
-        image_data = base64.b64encode(image_file.read()).decode("utf-8")
+def analyze_image_with_gpt(frame):
+    # JPEG-encode the frame in memory instead of writing it to disk and reading it back
+    ok, jpeg = cv2.imencode(".jpg", frame)
+    if not ok:
+        return "Error: Could not encode image."
+    image_data = base64.b64encode(jpeg).decode("utf-8")
 
     prompt = (
          "Describe the main elements of the image in simple, direct language. "
@@ -39,7 +41,7 @@ def analyze_image_with_gpt(image_path, api_key):
     )
 
     try:
-        response = client.chat.completions.create(
+        response = OAI_CLIENT.chat.completions.create(
             model="gpt-4o",
             messages=[
                 {
@@ -56,23 +58,11 @@ def analyze_image_with_gpt(image_path, api_key):
     except Exception as e:
         return f"Error: {str(e)}"
 
-def delete_image(image_path):
-    try:
-        if os.path.exists(image_path):
-            os.remove(image_path)
-            print(f"Image {image_path} deleted successfully.")
-        else:
-            print(f"Image {image_path} does not exist.")
-    except Exception as e:
-        print(f"Error deleting image: {str(e)}")
-
 
 # Main execution
-api_key = os.getenv("OPENAI_API_KEY")  # Get API key from environment variable
-image_path = capture_image()
-if image_path:
-    description = analyze_image_with_gpt(image_path, api_key)
+frame = capture_image()
+if frame is not None:
+    description = analyze_image_with_gpt(frame)
     print("Image Description:", description)
-    delete_image(image_path)  # Delete the image after analysis
 else:
     print("Image capture failed. Cannot proceed with analysis.")
@@ -3,14 +3,19 @@ import easyocr
 from gtts import gTTS
 import os
 
+# One EasyOCR reader per language, created once (loading its detector/recognizer weights is the slow part)
+OCR_READERS = {'en': easyocr.Reader(['en'])}
+
+def get_ocr_reader(language):
+    if language not in OCR_READERS:
+        OCR_READERS[language] = easyocr.Reader([language])
+    return OCR_READERS[language]
+
 cap = cv2.VideoCapture(0)
 
-def perform_ocr_and_speak(image_path, language='en', output_file='output.mp3'):
-    # Initialize the EasyOCR reader
-    reader = easyocr.Reader([language])
-    
-    # Perform OCR on the image
-    result = reader.readtext(image_path)
+def perform_ocr_and_speak(image, language='en', output_file='output.mp3'):
+    # Perform OCR on the image (a BGR frame straight from the camera, no temp file needed)
+    result = get_ocr_reader(language).readtext(image)
     
     # Extract text from the result
     extracted_text = " ".join([text[1] for text in result])
@@ -33,9 +38,7 @@ else:
     # Capture a single frame
     ret, frame = cap.read()
     if ret:
-        # Save the frame as an image
-        cv2.imwrite("captured_frame.jpg", frame)
-        print("Frame captured and saved as 'captured_frame.jpg'")
+        print("Frame captured")
     else:
         print("Error: Could not read frame")
 
@@ -43,7 +46,7 @@ else:
 cap.release()
 
 # Example usage
-image_path = frame #"C:/Users/user/Desktop/preview-page0.jpg"  # Replace with the path to your image
-perform_ocr_and_speak(image_path)
+image = frame # or a path, e.g. "C:/Users/user/Desktop/preview-page0.jpg"
+perform_ocr_and_speak(image)
 
 
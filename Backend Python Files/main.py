@@ -4,61 +4,121 @@
 # ]]]
 # -*- coding: utf-8 -*-
 # [[[end]]]
-from fastapi import FastAPI, Request, File, UploadFile, Form, WebSocket, HTTPException
+from fastapi import FastAPI, Request, File, UploadFile, Form, WebSocket, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from sentence_transformers import SentenceTransformer, util
+from fastapi.responses import JSONResponse, StreamingResponse
+from sentence_encoder import load_sentence_model
+from batching import MicroBatcher
+import torch
+import torch.nn.functional as F
 from ultralytics import YOLO
 import mediapipe as mp
-from transformers import pipeline
+from hand_tracking import HandLandmarkerPool, to_landmark_proto, WRIST
+from depth_engine import load_depth_estimator
+from export_models import export_yolo
 from PIL import Image
 import numpy as np
-import math
 import easyocr
 from gtts import gTTS
 import os
 import base64
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI
 import shutil
 import cv2
 import io
+import json
+import re
+import wave
 import traceback
+import asyncio
+import threading
+from enum import IntEnum
 import time # Added for unique filenames
 
 # --- Model Configurations ---
+YOLO_WEIGHTS = "yolov8l.pt"
+YOLO_ENGINE = "yolov8l.engine" # TensorRT FP16 engine built by export_models.py (fixed 640x640, batch 1)
+YOLO_IMGSZ = 640
+# Build a missing engine at import; start_server.sh builds it before Gunicorn forks and turns this off
+YOLO_AUTO_EXPORT = os.getenv("SPECTRA_EXPORT", "1") == "1"
+# FP16 inference for the .pt fallback on CUDA (Ultralytics only honours half on CUDA; engines have their precision baked in)
+YOLO_HALF = torch.cuda.is_available()
+OCR_MAX_SIDE = 1600 # Longer side images are downscaled to before OCR
+GPT_MAX_SIDE = 768 # GPT-4o "low" detail only looks at a 512px tile, so there is no point uploading more
+FINDER_MAX_SIDE = 640 # YOLO letterboxes to 640 and depth resizes to 518, so the finder never needs more
+HAND_POOL_SIZE = int(os.getenv("SPECTRA_HAND_POOL", min(4, os.cpu_count() or 1))) # Landmarkers for concurrent requests
+PIPER_VOICE = "en_US-amy-medium.onnx" # Local Piper TTS voice (with its .onnx.json config alongside)
+
 print("Loading models...")
 start_time = time.time()
 
 try:
-    sentance_model = SentenceTransformer('all-MiniLM-L6-v2')
+    # INT8 ONNX Runtime encoder if it has been built, otherwise the regular SentenceTransformer
+    sentance_model = load_sentence_model()
+    # Single-query encodes from concurrent requests are coalesced into one encode() call
+    query_encoder = MicroBatcher(lambda texts: sentance_model.encode(texts, convert_to_tensor=True), max_batch=32)
     print(f"SentenceTransformer loaded in {time.time() - start_time:.2f}s")
     st_load_time = time.time()
 
-    # yolo model
-    model = YOLO("yolov8l.pt")
+    # yolo model (prefer the prebuilt TensorRT engine, fall back to the PyTorch weights)
+    # On a CUDA host a missing engine is built once here (fixed 640x640, batch 1, FP16) and reused on later starts
+    if not os.path.exists(YOLO_ENGINE) and YOLO_AUTO_EXPORT and torch.cuda.is_available():
+        print(f"{YOLO_ENGINE} not found, exporting it from {YOLO_WEIGHTS} (one-time, takes a few minutes)...")
+        try:
+            export_yolo(YOLO_WEIGHTS)
+        except Exception as e:
+            # A failed export (TensorRT missing, out of GPU memory, ...) only costs speed: serve the .pt weights
+            print(f"Error exporting {YOLO_ENGINE}: {e}")
+            print(traceback.format_exc())
+    model = None
+    if os.path.exists(YOLO_ENGINE):
+        try:
+            model = YOLO(YOLO_ENGINE, task="detect")
+        except Exception as e:
+            # e.g. a partial engine left by an interrupted export, or one built for another GPU / TensorRT
+            print(f"Error loading {YOLO_ENGINE}: {e}. Delete it and run export_models.py to rebuild it.")
+    if model is None:
+        print(f"{YOLO_ENGINE} not usable, falling back to {YOLO_WEIGHTS}. Run export_models.py on a CUDA host to build it.")
+        model = YOLO(YOLO_WEIGHTS)
+    # Normalized SBERT embeddings of the fixed YOLO class names, so matching detections against
+    # a query is a single matmul instead of re-encoding the detected labels on every request
+    class_names = np.array(list(model.names.values()))
+    class_embeddings = F.normalize(sentance_model.encode(class_names.tolist(), convert_to_tensor=True), dim=-1)
+    # Separate CUDA stream so YOLO can overlap with the depth engine (None = no-op off CUDA)
+    yolo_stream = torch.cuda.Stream() if torch.cuda.is_available() else None
     print(f"YOLO loaded in {time.time() - st_load_time:.2f}s")
     yolo_load_time = time.time()
 
-    # depthestimator model
-    depth_estimator = pipeline(task="depth-estimation", model="depth-anything/Depth-Anything-V2-Small-hf", device='mps')
+    # depthestimator model (TensorRT engine if built, otherwise the transformers pipeline)
+    depth_estimator = load_depth_estimator(device='mps')
     print(f"Depth Estimator loaded in {time.time() - yolo_load_time:.2f}s")
     depth_load_time = time.time()
 
-    # hand tracker model
-    mp_hands = mp.solutions.hands
-    hands = mp_hands.Hands(static_image_mode=False, # Changed to False for potential video stream processing
-                           max_num_hands=2,
-                           min_detection_confidence=0.5,
-                           min_tracking_confidence=0.5)
-    mp_drawing = mp.solutions.drawing_utils
+    # hand tracker model (MediaPipe Tasks, GPU delegate with CPU fallback)
+    # IMAGE mode: every request is an independent photo, so there is no video timeline to track along.
+    # A pool of instances so concurrent requests (each in its own worker thread) detect hands in parallel.
+    # The landmarkers themselves are built in each serving process on first use (see warmup_models)
+    hands = HandLandmarkerPool(HAND_POOL_SIZE, num_hands=2)
+    # Requests run in worker threads; the finder's models share preallocated buffers, so one frame at a time
+    finder_lock = threading.Lock()
     print(f"Mediapipe Hands loaded in {time.time() - depth_load_time:.2f}s")
     hands_load_time = time.time()
 
     # EasyOCR reader (initialize only once)
-    # Note: Consider specifying the GPU setting for EasyOCR if needed: easyocr.Reader(['en'], gpu=True) # Or False
-    ocr_reader = easyocr.Reader(['en'])
+    # EasyOCR can't use MPS, so it runs on CUDA when present and otherwise on CPU with INT8-quantized weights
+    ocr_reader = easyocr.Reader(['en'], gpu=torch.cuda.is_available(), quantize=True)
     print(f"EasyOCR loaded in {time.time() - hands_load_time:.2f}s")
+    ocr_load_time = time.time()
+
+    # Local Piper TTS keeps speech synthesis off the network; gTTS is only the fallback
+    piper_voice = None
+    if os.path.exists(PIPER_VOICE):
+        from piper import PiperVoice
+        piper_voice = PiperVoice.load(PIPER_VOICE, config_path=f"{PIPER_VOICE}.json", use_cuda=False)
+        print(f"Piper voice loaded in {time.time() - ocr_load_time:.2f}s")
+    else:
+        print(f"{PIPER_VOICE} not found, falling back to gTTS for speech.")
 
 except Exception as e:
     print(f"Error loading models: {e}")
@@ -70,15 +130,27 @@ print(f"All models loaded successfully in {time.time() - start_time:.2f}s")
 # --- End Model Configurations ---
 
 # --- Helper Functions ---
-def perform_ocr_and_speak(image: Image.Image, language='en') -> str:
-    """Performs OCR on a PIL image and returns the extracted text."""
+# Octant lookup for the 8 directions in hand_to_object_finder. The key packs
+# (dx < 0, dy < 0, |dy| > |dx|*tan(22.5), |dy| > |dx|*tan(67.5)) into 4 bits; the table was filled by
+# enumerating offsets against the old round(atan2(-dy, dx) / 45deg) % 8 so the result is identical,
+# just without the libm call. Keys 1, 5, 9, 13 (steep but not diagonal) can't occur.
+TAN_22_5 = 0.41421356237309503
+TAN_67_5 = 2.414213562373095
+DIRECTION_LUT = (0, 6, 7, 6, 0, 2, 1, 2, 4, 6, 5, 6, 4, 2, 3, 2)
+
+def direction_index(dx: int, dy: int) -> int:
+    """Index into the 8 directions for an image-space offset (y pointing down), 0 = right, counter-clockwise."""
+    ax, ay = abs(dx), abs(dy)
+    return DIRECTION_LUT[((dx < 0) << 3) | ((dy < 0) << 2) | ((ay > ax * TAN_22_5) << 1) | (ay > ax * TAN_67_5)]
+
+def perform_ocr_and_speak(image_np_bgr: np.ndarray, language='en') -> str:
+    """Performs OCR on a BGR array (the format EasyOCR prefers) and returns the extracted text."""
     try:
-        # Convert PIL image to NumPy array (format EasyOCR prefers)
-        image_np = np.array(image)
-        image_np_bgr = cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR)
+        # Detection cost grows with pixel count, so cap the longer side before OCR
+        image_np_bgr = _shrink_to(image_np_bgr, OCR_MAX_SIDE)
 
-        # Perform OCR
-        result = ocr_reader.readtext(image_np_bgr)
+        # Perform OCR (recognizer batches text lines instead of running them one at a time)
+        result = ocr_reader.readtext(image_np_bgr, paragraph=False, detail=1, batch_size=8, workers=0)
 
         # Extract text
         extracted_text = " ".join([text[1] for text in result])
@@ -91,37 +163,46 @@ def perform_ocr_and_speak(image: Image.Image, language='en') -> str:
         print(traceback.format_exc())
         return "Error performing text recognition."
 
-def analyze_image_with_gpt(image: Image.Image, api_key: str) -> str:
-    """Sends a PIL image to OpenAI GPT-4o for description."""
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+async def describe_image_sentences(image_data: str):
+    """Streams a GPT-4o description of a base64 JPEG (from _prep_for_gpt), yielding each sentence as soon as it is complete."""
+    prompt = (
+        "Describe the main elements of the image in simple, direct language for a visually impaired user. "
+        "Focus on key objects, their spatial relationships (e.g., 'a cup is on the table to your left'), and essential features. "
+        "Avoid ambiguity and excessive detail. Mention people if present. Keep the description concise (around 5-10 seconds of speech)."
+        # "Explain this as if the user is blind or has impaired vision in adequate detail." # Removed redundancy
+    )
+
+    stream = await openai_client.chat.completions.create(
+        model="gpt-4o",
+        messages=[
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prompt},
+                    {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_data}", "detail": "low"}} # Use low detail for faster processing
+                ]
+            }
+        ],
+        max_tokens=150, # Reduced max_tokens for brevity
+        stream=True
+    )
+    pending_text = ""
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        pending_text += chunk.choices[0].delta.content or ""
+        *sentences, pending_text = SENTENCE_END.split(pending_text)
+        for sentence in sentences:
+            yield sentence
+    if pending_text.strip():
+        yield pending_text.strip()
+
+async def analyze_image_with_gpt(image_data: str) -> str:
+    """Sends a base64 JPEG (from _prep_for_gpt) to OpenAI GPT-4o for description."""
     try:
-        client = OpenAI(api_key=api_key)
-
-        # Convert PIL image to base64
-        buffered = io.BytesIO()
-        image.save(buffered, format="JPEG") # Save as JPEG for smaller size
-        image_data = base64.b64encode(buffered.getvalue()).decode("utf-8")
-
-        prompt = (
-            "Describe the main elements of the image in simple, direct language for a visually impaired user. "
-            "Focus on key objects, their spatial relationships (e.g., 'a cup is on the table to your left'), and essential features. "
-            "Avoid ambiguity and excessive detail. Mention people if present. Keep the description concise (around 5-10 seconds of speech)."
-            # "Explain this as if the user is blind or has impaired vision in adequate detail." # Removed redundancy
-        )
-
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_data}", "detail": "low"}} # Use low detail for faster processing
-                    ]
-                }
-            ],
-            max_tokens=150 # Reduced max_tokens for brevity
-        )
-        description = response.choices[0].message.content
+        description = " ".join([sentence async for sentence in describe_image_sentences(image_data)])
         print("GPT Description:", description)
         return description
     except Exception as e:
@@ -130,19 +211,21 @@ def analyze_image_with_gpt(image: Image.Image, api_key: str) -> str:
         return "Error analyzing the image."
 
 def text_to_speech(text: str) -> str | None:
-    """Converts text to speech using gTTS and returns base64 encoded audio."""
+    """Converts text to speech (Piper WAV, or gTTS MP3 as a fallback) and returns base64 encoded audio."""
     if not text or text.startswith("Error"):
         print("Skipping TTS for empty or error text.")
         return None
     try:
-        tts = gTTS(text=text, lang='en', slow=False)
-        # Use BytesIO instead of writing to disk
-        audio_fp = io.BytesIO()
-        tts.write_to_fp(audio_fp)
-        audio_fp.seek(0) # Rewind the buffer to the beginning
+        audio_fp = io.BytesIO() # Use BytesIO instead of writing to disk
+        if piper_voice is not None:
+            with wave.open(audio_fp, "wb") as wav_file:
+                piper_voice.synthesize(text, wav_file)
+        else:
+            tts = gTTS(text=text, lang='en', slow=False)
+            tts.write_to_fp(audio_fp)
 
-        # Read the audio data and encode it as base64
-        audio_data = audio_fp.read()
+        # Encode the audio data as base64
+        audio_data = audio_fp.getvalue()
         audio_base64 = base64.b64encode(audio_data).decode("utf-8")
         print(f"Generated TTS audio ({len(audio_data)} bytes)")
         return audio_base64
@@ -151,72 +234,96 @@ def text_to_speech(text: str) -> str | None:
         print(traceback.format_exc())
         return None
 
-def hand_to_object_finder(image: Image.Image, query_text: str) -> str:
-    """Finds an object relative to the hand in a PIL image based on a text query."""
+def text_to_speech_stream(text: str):
+    """
+    Yields (audio_format, chunk) pairs as speech is synthesized: raw 16-bit mono PCM per
+    sentence from Piper, or 4 KB slices of the gTTS MP3. Chunks concatenate to the full audio.
+    """
+    if not text or text.startswith("Error"):
+        print("Skipping TTS for empty or error text.")
+        return
+    if piper_voice is not None:
+        audio_format = f"pcm_s16le;rate={piper_voice.config.sample_rate}"
+        for pcm_chunk in piper_voice.synthesize_stream_raw(text):
+            yield audio_format, pcm_chunk
+    else:
+        audio_fp = io.BytesIO()
+        gTTS(text=text, lang='en', slow=False).write_to_fp(audio_fp)
+        audio_data = audio_fp.getbuffer()
+        for start in range(0, len(audio_data), 4096):
+            yield "mp3", bytes(audio_data[start:start + 4096])
+
+def draw_detections(frame: np.ndarray, xyxy: np.ndarray, labels, hand_results) -> None:
+    """Draws YOLO boxes and hand landmarks onto frame in place (only for ?debug=1 requests)."""
+    for (x1, y1, x2, y2), label in zip(xyxy.tolist(), labels):
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        cv2.putText(frame, str(label), (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+    for hand_landmarks in hand_results.hand_landmarks:
+        mp.solutions.drawing_utils.draw_landmarks(frame, to_landmark_proto(hand_landmarks), mp.solutions.hands.HAND_CONNECTIONS)
+
+def hand_to_object_finder(image_np: np.ndarray, query_text: str, debug_frame: np.ndarray | None = None) -> str:
+    """
+    Finds an object relative to the hand in a BGR array (from _prep_for_finder) based on a text query.
+    Detections are drawn onto debug_frame (a copy of image_np) when one is passed; otherwise nothing is drawn.
+    """
     try:
-        query_embedding = sentance_model.encode(query_text, convert_to_tensor=True)
-        target_object_name = '' # Store the name identified by sentence transformer
         directions = ["directly right", "up and right", "directly up", "up and left",
                       "directly left", "down and left", "directly down", "down and right"]
 
-        # Convert PIL image to NumPy array (in BGR format for OpenCV)
-        image_np = np.array(image)
-        image_np = cv2.cvtColor(image_np, cv2.COLOR_RGB2BGR)
-        image_height, image_width = image_np.shape[:2]
-
-        # Convert the BGR image to RGB for Mediapipe and Depth Estimator
+        # YOLO takes the BGR array as decoded; Mediapipe and the Depth Estimator share the one RGB conversion
         rgb_image = cv2.cvtColor(image_np, cv2.COLOR_BGR2RGB)
-        pil_image = Image.fromarray(rgb_image) # For depth estimator
+        image_height, image_width = image_np.shape[:2]
 
         # --- Model Processing ---
-        hand_results = hands.process(rgb_image)
-        yolo_results = model(image_np) # Use BGR image for YOLO if trained on it
-        depth_result = depth_estimator(pil_image)
-        depth_map = np.array(depth_result['depth'])
+        # Every answer is relative to the hand, so hands go first (cheap at this size) and a frame without
+        # one returns before YOLO, depth or the query encode run. Otherwise depth is queued on its own
+        # CUDA stream and overlaps YOLO on a second one
+        hand_results = hands.detect(rgb_image)
+        if not hand_results.hand_landmarks:
+            return "I don't detect your hand. Hold it up in front of the camera and try again."
+        with finder_lock:
+            depth_estimator.infer_async(rgb_image)
+            with torch.cuda.stream(yolo_stream):
+                yolo_results = model(image_np, imgsz=YOLO_IMGSZ, half=YOLO_HALF, verbose=False)
+            if yolo_stream is not None:
+                yolo_stream.synchronize()
+            depth = depth_estimator.collect()
+        query_embedding = query_encoder(query_text)
         # --- End Model Processing ---
 
-        detected_objects = [] # Store (label, score, box)
-        for box in yolo_results[0].boxes:
-            class_id = int(box.cls)
-            label = model.names[class_id]
-            # Skip people
-            if label.lower() == 'person':
-                continue
-            confidence = float(box.conf)
-            coords = list(map(int, box.xyxy[0]))
-            detected_objects.append({"label": label, "confidence": confidence, "box": coords})
-
-        if not detected_objects:
+        # Pull every box out of YOLO with a single device->host copy of the (N, 6) [x1, y1, x2, y2, conf, cls]
+        # table and drop people (COCO class 0)
+        box_data = yolo_results[0].boxes.data.cpu().numpy()
+        class_ids = box_data[:, 5].astype(np.int32)
+        xyxy = box_data[:, :4].astype(np.int32)
+        not_person = class_ids != 0
+        class_ids, xyxy = class_ids[not_person], xyxy[not_person]
+        object_labels = class_names[class_ids]
+        if debug_frame is not None:
+            draw_detections(debug_frame, xyxy, object_labels, hand_results)
+        if class_ids.size == 0:
             return "No objects detected in the scene."
+        centers = (xyxy[:, :2] + xyxy[:, 2:]) // 2
 
-        # Find the object best matching the query using SentenceTransformer
-        object_labels = [obj["label"] for obj in detected_objects]
-        if not object_labels:
-             return "No non-person objects detected." # Handle case after filtering people
-
-        doc_embeddings = sentance_model.encode(object_labels, convert_to_tensor=True)
-        cosine_scores = util.cos_sim(query_embedding, doc_embeddings)[0]
-        ranked_docs = sorted(zip(cosine_scores.tolist(), detected_objects), reverse=True, key=lambda x: x[0])
+        # Find the object best matching the query using SentenceTransformer: score the query against all
+        # cached class embeddings in one matmul, then look the detections up by class id on the CPU
+        class_scores = (class_embeddings @ F.normalize(query_embedding, dim=-1)).cpu().numpy()
+        cosine_scores = class_scores[class_ids]
+        best_index = int(cosine_scores.argmax())
 
         # Check if the best match score is reasonably high
-        best_score, best_match_object = ranked_docs[0]
-        print(f"Best match: {best_match_object['label']} with score {best_score:.2f}")
+        best_score, target_object_name = float(cosine_scores[best_index]), str(object_labels[best_index])
+        print(f"Best match: {target_object_name} with score {best_score:.2f}")
         if best_score < 0.3: # Adjust threshold as needed
              return f"I couldn't clearly identify a {query_text}. Objects detected: {', '.join(object_labels)}."
 
-        target_object_name = best_match_object["label"]
-        x1, y1, x2, y2 = best_match_object["box"]
-        object_center_x = (x1 + x2) // 2
-        object_center_y = (y1 + y2) // 2
-
-        if not hand_results.multi_hand_landmarks:
-            return f"I see a {target_object_name}, but I don't detect your hand."
+        object_center_x, object_center_y = map(int, centers[best_index])
 
         # Assume the first detected hand is the relevant one
-        hand_landmarks = hand_results.multi_hand_landmarks[0]
+        hand_landmarks = hand_results.hand_landmarks[0]
 
         # Use wrist landmark as hand position
-        wrist_landmark = hand_landmarks.landmark[mp_hands.HandLandmark.WRIST]
+        wrist_landmark = hand_landmarks[WRIST]
         # Ensure coordinates are within image bounds
         hand_x = min(max(0, int(wrist_landmark.x * image_width)), image_width - 1)
         hand_y = min(max(0, int(wrist_landmark.y * image_height)), image_height - 1)
@@ -225,49 +332,35 @@ def hand_to_object_finder(image: Image.Image, query_text: str) -> str:
         dx = object_center_x - hand_x
         dy = object_center_y - hand_y # Y is typically inverted in image coordinates (0 at top)
 
-        # Calculate angle (adjusting for typical image coordinate system)
-        angle_radians = math.atan2(-dy, dx) # Negate dy for standard angle calculation
-
-        # Normalize angle to 0 to 2*pi
-        # angle_normalized = (angle_radians + 2 * math.pi) % (2 * math.pi)
-
-        # Determine direction index (adjusting segments)
-        # Angle ranges (approx): Right(> -pi/8, <= pi/8), UR(> pi/8, <= 3pi/8), etc.
-        angle_segment = math.pi / 4 # 45 degrees
-        angle_index = round(angle_radians / angle_segment) % 8
-        # Map index: 0:R, 1:UR, 2:U, 3:UL, 4:L, 5:DL, 6:D, 7:DR --> becomes -4: L, -3: DL, etc.
-        # Correct mapping based on angle ranges and desired output:
-        # Example: angle_radians = 0 (Right) -> angle_index = 0 -> directions[0]
-        # Example: angle_radians = pi/2 (Up) -> angle_index = 2 -> directions[2]
-        # Example: angle_radians = pi (Left) -> angle_index = 4 -> directions[4]
-        # Example: angle_radians = -pi/2 (Down) -> angle_index = -2 -> maps to 6 -> directions[6]
-        final_angle_index = (int(angle_index) + 8) % 8 # Ensure index is 0-7
+        # Direction index via the octant lookup (0:R, 1:UR, 2:U, 3:UL, 4:L, 5:DL, 6:D, 7:DR)
+        final_angle_index = direction_index(dx, dy)
 
         # Depth comparison
-        # Ensure depth map coordinates are valid
-        object_depth = depth_map[object_center_y, object_center_x]
-        hand_depth = depth_map[hand_y, hand_x]
+        # Only two points are needed, so read them from the model-resolution prediction
+        # (7x7 window means, so a point on a depth edge doesn't flip the thresholds below)
+        object_depth = depth.at(object_center_x, object_center_y)
+        hand_depth = depth.at(hand_x, hand_y)
         depth_difference = abs(float(hand_depth) - float(object_depth))
 
-        # Calculate distance in pixels
-        pixel_distance = math.sqrt(dx**2 + dy**2)
+        # Squared distance in pixels (compared against a squared threshold, so no sqrt is needed)
+        pixel_distance_sq = dx * dx + dy * dy
 
         print(f"Object='{target_object_name}' Center=({object_center_x},{object_center_y}) Depth={object_depth:.2f}")
         print(f"Hand Wrist=({hand_x},{hand_y}) Depth={hand_depth:.2f}")
-        print(f"Pixel Dist={pixel_distance:.1f} Depth Diff={depth_difference:.2f} Angle={math.degrees(angle_radians):.1f} Rad={angle_radians:.2f} Index={final_angle_index}")
+        print(f"Pixel Dist^2={pixel_distance_sq} Depth Diff={depth_difference:.2f} Index={final_angle_index}")
 
         # Refined Logic (adjust thresholds based on testing depth_map values)
         # NOTE: Depth values from 'depth-anything' are relative, not metric. Thresholds need tuning.
         # High depth value usually means closer.
         depth_threshold_far = 80 # Tune this - difference indicating significant distance apart
         depth_threshold_near = 30 # Tune this - difference indicating similar depth
-        pixel_distance_threshold_reach = 150 # Tune this
+        pixel_distance_threshold_reach = 150 # Tune this (pixels; compared squared below)
 
         if depth_difference >= depth_threshold_far and float(hand_depth) < float(object_depth) : # Hand depth < object depth = hand is further
              # Check if the object is significantly further than the hand
              direction_to_move = "forward" # Or adjust based on relative depth
              return f"Move your hand {direction_to_move} towards the {target_object_name}, which is {directions[final_angle_index]} of your hand."
-        elif depth_difference <= depth_threshold_near and pixel_distance <= pixel_distance_threshold_reach:
+        elif depth_difference <= depth_threshold_near and pixel_distance_sq <= pixel_distance_threshold_reach * pixel_distance_threshold_reach:
              return f"The {target_object_name} is within reach, {directions[final_angle_index]} of your hand."
         else:
             # Default direction instruction
@@ -283,6 +376,8 @@ load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
 if not api_key:
     print("Warning: OPENAI_API_KEY not found in environment variables.")
+# One client for the whole process so its HTTP connection pool (and TLS session) is reused across requests
+openai_client = AsyncOpenAI(api_key=api_key) if api_key else None
 # print("DEBUG: OpenAI API Key loaded.") # Keep this commented unless debugging key issues
 
 app = FastAPI()
@@ -298,20 +393,230 @@ app.add_middleware(
 
 # Precompute prompt embeddings for intent classification
 prompts = ['Read the text', 'describe what I am viewing', 'Identify object location', 'Other']
+
+class Intent(IntEnum):
+    """What a query asks for; the values are indices into prompts (and rows of prompt_embeddings)."""
+    READ_TEXT = 0
+    DESCRIBE = 1
+    LOCATE = 2
+    OTHER = 3
+
+IMAGE_INTENTS = (Intent.READ_TEXT, Intent.DESCRIBE, Intent.LOCATE) # Intents that need an image
+OTHER_RESPONSE = "I am not equipped to handle that request. Please try asking something else, like 'read the text', 'describe what I see', or 'find the [object]'."
+UNCLEAR_RESPONSE = "I'm sorry, I couldn't quite understand your request. Could you please rephrase?"
 try:
-    prompt_embeddings = sentance_model.encode(prompts, convert_to_tensor=True)
+    # L2-normalized once so intent classification is a single matmul + argmax on the model's device
+    prompt_embeddings = F.normalize(sentance_model.encode(prompts, convert_to_tensor=True), dim=-1)
     print("Prompt embeddings computed.")
 except Exception as e:
     print(f"Error computing prompt embeddings: {e}")
     exit(1)
+
+@app.on_event("startup")
+def warmup_models():
+    """
+    Runs every model once on a dummy frame so CUDA context setup, cuDNN autotuning, TensorRT
+    binding allocation and kernel JIT happen here instead of on the first user request.
+    Runs in each serving process, so it is also where that process builds its hand landmarkers
+    (see HandLandmarkerPool); CUDA models are loaded by the worker itself, since gunicorn.conf.py
+    doesn't preload on CUDA hosts.
+    """
+    start_warmup_time = time.time()
+    try:
+        dummy_rgb = np.zeros((480, 640, 3), dtype=np.uint8)
+        sentance_model.encode("warmup", convert_to_tensor=True)
+        with torch.cuda.stream(yolo_stream):
+            model(dummy_rgb, imgsz=YOLO_IMGSZ, half=YOLO_HALF, verbose=False)
+        if yolo_stream is not None:
+            yolo_stream.synchronize()
+        depth_estimator.infer(dummy_rgb)
+        hands.warmup()
+        ocr_reader.readtext(dummy_rgb, batch_size=8, workers=0)
+        print(f"Models warmed up in {time.time() - start_warmup_time:.2f}s")
+    except Exception as e:
+        # A failed warmup only costs first-request latency, so keep serving
+        print(f"Error during model warmup: {e}")
+        print(traceback.format_exc())
 # --- End FastAPI App Setup ---
 
+# --- Request Pipeline ---
+def classify_intent(query: str) -> tuple[float, Intent]:
+    """Returns (score, intent) for the prompt closest to the query."""
+    start_intent_time = time.time()
+    query_embedding = F.normalize(query_encoder(query), dim=-1)
+    cosine_scores = prompt_embeddings @ query_embedding
+    intent = Intent(int(cosine_scores.argmax()))
+    score = float(cosine_scores[intent])
+    print(f"Intent classified as '{prompts[intent]}' with score {score:.2f} in {time.time() - start_intent_time:.2f}s")
+    return score, intent
+
+async def read_upload_image(file: UploadFile | None, intent: Intent) -> bytes | None:
+    """Reads the uploaded image bytes, raising HTTPException if they are empty or missing but required."""
+    if file and file.content_type and 'image/' in file.content_type:
+        contents = await file.read()
+        if not contents:
+             print("Error: Uploaded file is empty.")
+             raise HTTPException(status_code=400, detail="Uploaded image file is empty.")
+        return contents
+    elif intent in IMAGE_INTENTS: # Check if image is required but not provided
+         print(f"Error: Intent '{prompts[intent]}' requires an image, but none was provided.")
+         raise HTTPException(status_code=400, detail=f"This request ('{prompts[intent]}') requires an image. Please provide one.")
+    return None
+
+def _decode_image(contents: bytes, max_side: int) -> np.ndarray:
+    """
+    Decodes an upload straight to a BGR array with OpenCV (no PIL image in between). JPEGs are
+    decoded at the smallest DCT scale (1/2, 1/4, 1/8) that still leaves the longer side >= max_side.
+    """
+    width, height = Image.open(io.BytesIO(contents)).size # Parses the header only, nothing is decoded
+    flags = cv2.IMREAD_COLOR
+    for factor, reduced_flag in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if max(width, height) // factor >= max_side:
+            flags = reduced_flag
+            break
+    # Ignore EXIF orientation, as the PIL decode did, so pixel coordinates keep their meaning
+    image_np = cv2.imdecode(np.frombuffer(contents, np.uint8), flags | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image_np is None:
+        raise ValueError("OpenCV could not decode the image")
+    return image_np
+
+def _shrink_to(image_np: np.ndarray, max_side: int) -> np.ndarray:
+    """Downscales so the longer side is at most max_side (aspect preserved); smaller images pass through."""
+    longest_side = max(image_np.shape[:2])
+    if longest_side <= max_side:
+        return image_np
+    scale = max_side / longest_side
+    return cv2.resize(image_np, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+def _prep_for_gpt(image_np: np.ndarray) -> str:
+    """Downscales to GPT_MAX_SIDE and returns the image as a base64 JPEG."""
+    # Encode as JPEG with OpenCV (libjpeg-turbo SIMD paths) and base64 the raw buffer directly
+    ok, jpeg = cv2.imencode(".jpg", _shrink_to(image_np, GPT_MAX_SIDE), [cv2.IMWRITE_JPEG_QUALITY, 75])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return base64.b64encode(jpeg).decode("utf-8")
+
+def _prep_for_finder(image_np: np.ndarray) -> np.ndarray:
+    """Downscales to FINDER_MAX_SIDE (aspect preserved) and returns the BGR array."""
+    return _shrink_to(image_np, FINDER_MAX_SIDE)
+
+def prepare_image(contents: bytes | None, score: float, intent: Intent):
+    """
+    Decodes the upload only for intents that use it, straight into that path's input: a BGR array
+    for OCR and the finder, or a base64 JPEG for GPT. Raises HTTPException if it is invalid.
+    """
+    if contents is None or score <= 0.35 or intent not in IMAGE_INTENTS:
+        return None
+    start_image_read_time = time.time()
+    try:
+        if intent == Intent.READ_TEXT:
+            image = _decode_image(contents, OCR_MAX_SIDE)
+        elif intent == Intent.DESCRIBE:
+            image = _prep_for_gpt(_decode_image(contents, GPT_MAX_SIDE))
+        else:
+            image = _prep_for_finder(_decode_image(contents, FINDER_MAX_SIDE))
+    except Exception as img_err:
+        print(f"Error opening image: {img_err}")
+        raise HTTPException(status_code=400, detail=f"Invalid image file provided. Error: {img_err}")
+    print(f"Image prepared for '{prompts[intent]}' in {time.time() - start_image_read_time:.2f}s")
+    return image
+
+async def _read_text(query: str, image, debug_frame) -> str:
+    return await asyncio.to_thread(perform_ocr_and_speak, image)
+
+async def _describe(query: str, image, debug_frame) -> str:
+    if openai_client is None:
+        return "Error: OpenAI API key is not configured on the server."
+    return await analyze_image_with_gpt(image)
+
+async def _locate(query: str, image, debug_frame) -> str:
+    # Extract potential object name from the query for better matching
+    # Basic extraction: assume the object is the last part of the query
+    # More robust NLP could be used here.
+    object_query = query.replace("Identify object location", "").replace("find the", "").replace("where is the", "").strip()
+    if not object_query:
+        object_query = query # Fallback if simple extraction fails
+    print(f"Object query for hand_to_object_finder: '{object_query}'")
+    return await asyncio.to_thread(hand_to_object_finder, image, object_query, debug_frame)
+
+async def _other(query: str, image, debug_frame) -> str:
+    return OTHER_RESPONSE
+
+# Handler for each intent. Blocking model calls run in worker threads; the GPT-4o call is awaited directly.
+HANDLERS = {
+    Intent.READ_TEXT: _read_text,
+    Intent.DESCRIBE: _describe,
+    Intent.LOCATE: _locate,
+    Intent.OTHER: _other,
+}
+
+async def run_action(query: str, score: float, intent: Intent, image, debug_frame: np.ndarray | None = None) -> str:
+    """
+    Routes the request to the handler for its intent and returns the text response. image comes from
+    prepare_image; debug_frame is passed on to hand_to_object_finder to be annotated.
+    """
+    start_action_time = time.time()
+    intent_name = prompts[intent]
+    if score <= 0.35: # Confidence threshold for understanding the query
+        results_text = UNCLEAR_RESPONSE
+        intent_name = "Unknown" # Mark intent as unknown
+    else:
+        results_text = await HANDLERS[intent](query, image, debug_frame)
+
+    print(f"Action '{intent_name}' completed in {time.time() - start_action_time:.2f}s")
+    return results_text
+
+def _ndjson(payload: dict) -> bytes:
+    return (json.dumps(payload) + "\n").encode("utf-8")
+
+async def _speech_lines(text: str):
+    """Yields NDJSON audio lines for text, pulling each chunk from the (blocking) synthesizer in a worker thread."""
+    audio_chunks = text_to_speech_stream(text)
+    while (item := await asyncio.to_thread(next, audio_chunks, None)) is not None:
+        audio_format, chunk = item
+        yield _ndjson({"audio_format": audio_format, "audio_chunk_b64": base64.b64encode(chunk).decode("utf-8")})
+
+async def _describe_and_speak_lines(image_data: str):
+    """
+    Yields NDJSON lines for a streamed GPT-4o description: each sentence as {"text_delta": ...} followed
+    by its audio, then the full {"text": ...}. A producer task keeps reading the GPT stream into a queue,
+    so synthesizing one sentence overlaps generating the next.
+    """
+    sentences = asyncio.Queue()
+
+    async def read_description():
+        try:
+            async for sentence in describe_image_sentences(image_data):
+                await sentences.put(sentence)
+        except Exception as e:
+            print(f"Error interacting with OpenAI: {e}")
+            print(traceback.format_exc())
+            await sentences.put("Error analyzing the image.")
+        finally:
+            await sentences.put(None)
+
+    reader = asyncio.create_task(read_description())
+    spoken = []
+    try:
+        while (sentence := await sentences.get()) is not None:
+            spoken.append(sentence)
+            yield _ndjson({"text_delta": sentence})
+            async for line in _speech_lines(sentence):
+                yield line
+    finally:
+        reader.cancel() # Client went away mid-stream: stop reading from OpenAI
+    description = " ".join(spoken)
+    print("GPT Description:", description)
+    yield _ndjson({"text": description})
+# --- End Request Pipeline ---
+
 # --- API Endpoints ---
 @app.post("/process")
-async def process_request(query: str = Form(...), file: UploadFile | None = File(None)):
+async def process_request(query: str = Form(...), file: UploadFile | None = File(None), debug: bool = Query(False)):
     """
     Processes a text query, optionally with an image, determines intent,
     performs the required action, and returns text and audio response.
+    With ?debug=1, object location requests also return the annotated frame as a base64 JPEG.
     """
     print(f"\n--- Received Request ---")
     print(f"Query: '{query}'")
@@ -320,67 +625,17 @@ async def process_request(query: str = Form(...), file: UploadFile | None = File
         print(f"Filename: {file.filename}, Content-Type: {file.content_type}")
 
     start_process_time = time.time()
-    results_text = ""
-    image = None
 
     try:
-        # --- Intent Classification ---
-        start_intent_time = time.time()
-        query_embedding = sentance_model.encode(query, convert_to_tensor=True)
-        cosine_scores = util.cos_sim(query_embedding, prompt_embeddings)[0]
-        ranked_docs = sorted(zip(cosine_scores.tolist(), prompts), reverse=True, key=lambda x: x[0])
-        score, intent = ranked_docs[0]
-        print(f"Intent classified as '{intent}' with score {score:.2f} in {time.time() - start_intent_time:.2f}s")
-        # --- End Intent Classification ---
-
-        # --- Image Handling ---
-        if file and file.content_type and 'image/' in file.content_type:
-            start_image_read_time = time.time()
-            contents = await file.read()
-            if not contents:
-                 print("Error: Uploaded file is empty.")
-                 raise HTTPException(status_code=400, detail="Uploaded image file is empty.")
-            try:
-                image = Image.open(io.BytesIO(contents)).convert("RGB")
-                print(f"Image loaded ({image.width}x{image.height}) in {time.time() - start_image_read_time:.2f}s")
-            except Exception as img_err:
-                print(f"Error opening image: {img_err}")
-                raise HTTPException(status_code=400, detail=f"Invalid image file provided. Error: {img_err}")
-        elif intent in [prompts[0], prompts[1], prompts[2]]: # Check if image is required but not provided
-             print(f"Error: Intent '{intent}' requires an image, but none was provided.")
-             raise HTTPException(status_code=400, detail=f"This request ('{intent}') requires an image. Please provide one.")
-        # --- End Image Handling ---
-
-        # --- Action Routing ---
-        start_action_time = time.time()
-        if score <= 0.35: # Confidence threshold for understanding the query
-            results_text = "I'm sorry, I couldn't quite understand your request. Could you please rephrase?"
-            intent = "Unknown" # Mark intent as unknown
-        elif intent == prompts[0]: # Read the text
-            results_text = perform_ocr_and_speak(image)
-        elif intent == prompts[1]: # Describe what I am viewing
-            if not api_key:
-                 results_text = "Error: OpenAI API key is not configured on the server."
-            else:
-                 results_text = analyze_image_with_gpt(image, api_key)
-        elif intent == prompts[2]: # Identify object location
-            # Extract potential object name from the query for better matching
-            # Basic extraction: assume the object is the last part of the query
-            # More robust NLP could be used here.
-            object_query = query.replace("Identify object location", "").replace("find the", "").replace("where is the", "").strip()
-            if not object_query:
-                object_query = query # Fallback if simple extraction fails
-            print(f"Object query for hand_to_object_finder: '{object_query}'")
-            results_text = hand_to_object_finder(image, object_query)
-        else: # Other / Fallback
-            results_text = "I am not equipped to handle that request. Please try asking something else, like 'read the text', 'describe what I see', or 'find the [object]'."
-
-        print(f"Action '{intent}' completed in {time.time() - start_action_time:.2f}s")
-        # --- End Action Routing ---
+        score, intent = await asyncio.to_thread(classify_intent, query)
+        # Decoding, the models and TTS all block, so they run in worker threads to keep the event loop serving
+        image = await asyncio.to_thread(prepare_image, await read_upload_image(file, intent), score, intent)
+        debug_frame = image.copy() if debug and score > 0.35 and intent == Intent.LOCATE else None
+        results_text = await run_action(query, score, intent, image, debug_frame)
 
         # --- TTS Generation ---
         start_tts_time = time.time()
-        audio_base64 = text_to_speech(results_text)
+        audio_base64 = await asyncio.to_thread(text_to_speech, results_text)
         print(f"TTS generation finished in {time.time() - start_tts_time:.2f}s")
         # --- End TTS Generation ---
 
@@ -389,6 +644,9 @@ async def process_request(query: str = Form(...), file: UploadFile | None = File
             "recognized_text": results_text,
             "audio_base64": audio_base64
         }
+        if debug_frame is not None:
+            ok, jpeg = cv2.imencode(".jpg", debug_frame)
+            response_data["debug_image_base64"] = base64.b64encode(jpeg).decode("utf-8") if ok else None
         print(f"--- Request Processed Successfully in {time.time() - start_process_time:.2f}s ---")
         return JSONResponse(content=response_data)
         # --- End Prepare Response ---
@@ -398,7 +656,7 @@ async def process_request(query: str = Form(...), file: UploadFile | None = File
         print(f"HTTP Exception: {http_err.detail}")
         print(f"--- Request Failed (HTTP {http_err.status_code}) ---")
         # Optionally generate TTS for the error message
-        error_audio = text_to_speech(http_err.detail)
+        error_audio = await asyncio.to_thread(text_to_speech, http_err.detail)
         return JSONResponse(
             content={"error": http_err.detail, "audio_base64": error_audio},
             status_code=http_err.status_code
@@ -410,12 +668,58 @@ async def process_request(query: str = Form(...), file: UploadFile | None = File
         print(traceback.format_exc())
         print(f"--- Request Failed (Internal Server Error) ---")
         # Optionally generate TTS for a generic error message
-        error_audio = text_to_speech("Sorry, an internal error occurred.")
+        error_audio = await asyncio.to_thread(text_to_speech, "Sorry, an internal error occurred.")
         return JSONResponse(
             content={"error": "An internal server error occurred.", "audio_base64": error_audio},
             status_code=500
         )
 
+@app.post("/process-stream")
+async def process_request_stream(query: str = Form(...), file: UploadFile | None = File(None)):
+    """
+    Streaming variant of /process. Responds with newline-delimited JSON: a {"status": "processing"}
+    heartbeat, then {"text": ...} as soon as the action finishes, then {"audio_format": ...,
+    "audio_chunk_b64": ...} lines as speech is synthesized. Clients concatenate the audio chunks.
+    Image descriptions are streamed sentence by sentence instead: {"text_delta": ...} and that
+    sentence's audio lines as GPT-4o produces them, with the full {"text": ...} last.
+    """
+    print(f"\n--- Received Streaming Request ---")
+    print(f"Query: '{query}'")
+    start_process_time = time.time()
+
+    try:
+        score, intent = await asyncio.to_thread(classify_intent, query)
+        # Decoding, the models and TTS all block, so they run in worker threads to keep the event loop serving
+        image = await asyncio.to_thread(prepare_image, await read_upload_image(file, intent), score, intent)
+    except HTTPException as http_err:
+        print(f"HTTP Exception: {http_err.detail}")
+        return JSONResponse(content={"error": http_err.detail}, status_code=http_err.status_code)
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+        print(traceback.format_exc())
+        print(f"--- Streaming Request Failed (Internal Server Error) ---")
+        return JSONResponse(content={"error": "An internal server error occurred."}, status_code=500)
+
+    async def stream_response():
+        # Heartbeat first so mobile clients don't time out during OCR / GPT
+        yield _ndjson({"status": "processing"})
+        try:
+            if score > 0.35 and intent == Intent.DESCRIBE and openai_client is not None:
+                async for line in _describe_and_speak_lines(image):
+                    yield line
+            else:
+                results_text = await run_action(query, score, intent, image)
+                yield _ndjson({"text": results_text})
+                async for line in _speech_lines(results_text):
+                    yield line
+            print(f"--- Streaming Request Processed Successfully in {time.time() - start_process_time:.2f}s ---")
+        except Exception as e:
+            print(f"An unexpected error occurred while streaming: {e}")
+            print(traceback.format_exc())
+            yield _ndjson({"error": "An internal server error occurred."})
+
+    return StreamingResponse(stream_response(), media_type="application/x-ndjson")
+
 @app.get("/")
 async def root():
     """Root endpoint to check if the server is running."""
@@ -442,9 +746,18 @@ async def websocket_endpoint(websocket: WebSocket):
 # --- End API Endpoints ---
 
 # Script execution (for running with `python main.py`)
+# For production use ./start_server.sh (Gunicorn with --preload) so models are loaded once and shared across workers,
+# or a single process from the CLI: uvicorn main:app --host 0.0.0.0 --port 8000 --workers 1 --loop uvloop --http httptools --backlog 2048
 if __name__ == "__main__":
     import uvicorn
-    print("Starting Uvicorn server...")
+    # The reload watcher re-imports the module (and every model) on each change and pins a single worker,
+    # so it is only on with SPECTRA_DEV=1
+    reload = os.getenv("SPECTRA_DEV") == "1"
+    print(f"Starting Uvicorn server{' (reload enabled)' if reload else ''}...")
     # Use 0.0.0.0 to make it accessible on the local network
-    # Use reload=True for development, disable for production
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
+    if reload:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    else:
+        # Pass the already-imported app so the models aren't loaded a second time; loop/http "auto"
+        # pick uvloop and httptools when they are installed
+        uvicorn.run(app, host="0.0.0.0", port=8000, backlog=2048)
\ No newline at end of file
@@ -0,0 +1,92 @@
+"""
+Sentence embeddings for intent classification and object matching.
+
+OnnxSentenceEncoder runs all-MiniLM-L6-v2 exported to ONNX by export_models.py. On a CUDA
+host it runs the FP32 graph on ONNX Runtime's CUDA provider (which has no kernels for the
+dynamic INT8 ops); otherwise the dynamically quantized INT8 graph on the CPU provider, which
+uses VNNI INT8 dot products where the CPU has them. It reproduces SentenceTransformer's mean
+pooling and L2 normalization and mirrors its encode() signature, so callers don't change.
+
+Without the ONNX model the regular SentenceTransformer is used; on CUDA its transformer is
+wrapped in torch.compile, which fuses the attention/MLP ops into fewer Inductor kernels. It is
+compiled without CUDA graphs (mode="reduce-overhead"): Inductor keeps those in thread-local
+state, and the server encodes from the micro-batcher's thread, not the one that loaded it.
+"""
+import os
+import numpy as np
+import torch
+
+SBERT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+SBERT_ONNX = "minilm.onnx"
+SBERT_INT8_ONNX = "minilm_int8.onnx"
+SBERT_MAX_LENGTH = 256 # all-MiniLM-L6-v2's max_seq_length
+WARMUP_LENGTHS = (1, 4, 8, 16, 32) # Words per warmup sentence for the compiled encoder (spoken queries are short)
+
+class OnnxSentenceEncoder:
+    """ONNX Runtime MiniLM behind SentenceTransformer's encode() interface."""
+
+    def __init__(self, model_path: str = SBERT_INT8_ONNX, tokenizer_name: str = SBERT_MODEL,
+                 providers: tuple[str, ...] = ("CPUExecutionProvider",)):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+        self.session = ort.InferenceSession(model_path, providers=list(providers))
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def encode(self, sentences, convert_to_tensor: bool = False, **kwargs):
+        """Returns L2-normalized embeddings: 1-D for a single string, (N, 384) for a list."""
+        single = isinstance(sentences, str)
+        batch = [sentences] if single else list(sentences)
+        tokens = self.tokenizer(batch, padding=True, truncation=True, max_length=SBERT_MAX_LENGTH, return_tensors="np")
+        token_embeddings = self.session.run(None, {name: tokens[name].astype(np.int64) for name in self.input_names})[0]
+
+        # Mean pooling over real tokens, then L2 normalization (SentenceTransformer's Pooling + Normalize)
+        mask = tokens["attention_mask"][..., None].astype(np.float32)
+        embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+
+        embeddings = embeddings[0] if single else embeddings
+        return torch.from_numpy(embeddings) if convert_to_tensor else embeddings
+
+def load_sentence_model(model_path: str = SBERT_INT8_ONNX, cuda_model_path: str = SBERT_ONNX):
+    """
+    Loads the ONNX encoder if it has been built (FP32 on ONNX Runtime's CUDA provider when it is
+    available, INT8 on the CPU otherwise), falling back to the regular SentenceTransformer.
+    """
+    try:
+        import onnxruntime as ort
+        if "CUDAExecutionProvider" in ort.get_available_providers() and os.path.exists(cuda_model_path):
+            return OnnxSentenceEncoder(cuda_model_path, providers=("CUDAExecutionProvider", "CPUExecutionProvider"))
+        if os.path.exists(model_path):
+            return OnnxSentenceEncoder(model_path)
+        print(f"{model_path} not found, using SentenceTransformer. Run export_models.py to build it.")
+    except ImportError as e:
+        print(f"ONNX Runtime not available ({e}), using SentenceTransformer.")
+    from sentence_transformers import SentenceTransformer
+    if not torch.cuda.is_available():
+        return SentenceTransformer('all-MiniLM-L6-v2')
+    sentence_model = SentenceTransformer('all-MiniLM-L6-v2', device='cuda')
+    compile_sentence_model(sentence_model)
+    return sentence_model
+
+def compile_sentence_model(sentence_model) -> None:
+    """
+    torch.compiles the SentenceTransformer's transformer in place and warms it up, so the
+    compile (up to a minute) happens at load time. Falls back to eager if compilation fails.
+    """
+    transformer = sentence_model[0]
+    eager_model = transformer.auto_model
+    # dynamic=True: batch size and token count vary per call, so compile one shape-generic graph
+    # instead of recompiling for every new query length
+    transformer.auto_model = torch.compile(eager_model, fullgraph=True, dynamic=True)
+    try:
+        # Compilation is lazy: the first calls trace and compile. Several batch sizes and token
+        # lengths, so the dynamic-shape compile happens here rather than in a request
+        for words in WARMUP_LENGTHS:
+            text = " ".join(["warmup"] * words)
+            sentence_model.encode([text], convert_to_tensor=True)
+            sentence_model.encode([text] * 4, convert_to_tensor=True)
+    except Exception as e:
+        print(f"torch.compile of the sentence encoder failed ({e}), running it eagerly.")
+        transformer.auto_model = eager_model
@@ -0,0 +1,11 @@
+#!/bin/sh
+# Production entry point: on plain CPU hosts models are loaded once in the Gunicorn master and shared
+# with the Uvicorn workers; on CUDA / Apple hosts each worker loads its own. See gunicorn.conf.py.
+cd "$(dirname "$0")"
+# Build the YOLO engine here, before Gunicorn starts, rather than inside a booting worker (where the
+# export would run into the worker timeout); the workers then only load it
+if [ -e /dev/nvidiactl ] && [ ! -e yolov8l.engine ]; then
+    python export_models.py yolo || echo "YOLO engine export failed, the server will use yolov8l.pt"
+fi
+export SPECTRA_EXPORT=0
+exec gunicorn main:app -c gunicorn.conf.py "$@"